@@ -12,17 +12,38 @@ Batch/range control (Option 2):
 from __future__ import annotations
 
 import os
+import re
 import sys
+import gzip
 import json
+import math
 import time
+import random
+import struct
+import hashlib
 import traceback
-import urllib.request
-import urllib.error
-import urllib.parse
-from typing import Dict, List, Tuple
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+import requests  # bundled with the ArcGIS Pro Python environment
 import arcpy
 
+# Optional: stream-parse Overpass JSON so parsing overlaps the download and the
+# raw byte string never has to be held alongside the parsed elements.
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Optional: store tags as MessagePack in a BLOB field (smaller + faster than
+# json.dumps into a wide TEXT field). Falls back to JSON text when missing.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 # ------------- CONFIG ---------------------------------------------------------
 
 # AOI shapefile (your path)
@@ -30,7 +51,8 @@ import arcpy
 AOI_PATH = r"C:\Users\diaznd\Desktop\AOI_CSV_Join_SHP\CSV_BBoxes_Intersecting_AOIs.shp"
 
 # NGA Overpass endpoint (confirmed)
-osmapi_URL = "https://osm.com/osm/interpreter"
+OVERPASS_URL = "https://osm.com/osm/interpreter"
+OVERPASS_STATUS_URL = OVERPASS_URL.rsplit("/", 1)[0] + "/status"
 
 # Output GDB (confirmed)
 OUTPUT_GDB = os.path.abspath(r"C:\Users\name\Desktop\osm_batches\osm_clipped100.gdb")
@@ -41,44 +63,58 @@ TILE_DEG = 0.25
 # Small pad around AOI bbox to avoid edge clipping loss
 BBOX_BUFFER_DEG = 0.0005
 
+# When the AOIs are plain bounding-box rectangles (like CSV_BBoxes_*…shp),
+# extent containment IS polygon containment, so arcpy.analysis.Clip only needs
+# to run when some feature actually straddles the AOI boundary. Leave False
+# for arbitrarily-shaped AOIs: the in-Python extent prefilter still applies,
+# but every category goes through Clip as before.
+TRUST_AOI_EXTENT = False
+
 # Overpass timeouts / retries
 HTTP_TIMEOUT_SEC = 300
 OVERPASS_TIMEOUT = 180  # seconds for [timeout:] in the Overpass QL
 MAX_RETRIES = 5
-SLEEP_BETWEEN_TILES = 1.25  # seconds
+
+# Adaptive throttle: poll /api/status and only wait when the server reports
+# zero free slots, instead of a fixed sleep between every tile.
+STATUS_POLL_SEC = 1.0      # pause between status polls while all slots are busy
+STATUS_POLL_MAX = 60       # give up waiting after this many polls and just try
+RETRY_BASE_DELAY = 1.0     # exponential backoff base for transient failures
+RETRY_MAX_DELAY = 30.0     # cap on any single backoff sleep
+
+# Concurrent Overpass fetches per AOI (Overpass grants ~2-4 slots per client;
+# arcpy work stays on the main thread — only the HTTP wait is parallelized)
+MAX_CONCURRENT_FETCHES = 4
 
 # Optional guard to avoid pathological AOIs generating tons of tiles
 MAX_TILES_PER_AOI = 400
 
-# Tag filters (balanced for stability + useful content)
+# On-disk cache of Overpass responses keyed by the full QL string (which
+# embeds the tile bbox and TAG_QUERIES). Re-runs, crash resumes and
+# overlapping AOIs skip both the network and the server entirely.
+CACHE_ENABLED = True
+CACHE_DIR = os.path.join(os.path.dirname(OUTPUT_GDB), "overpass_cache")
+CACHE_SCHEMA = "v1"  # bump to invalidate every cached tile
+
+# Tag filters (balanced for stability + useful content).
+# One grouped regex selector per geometry class instead of one selector per
+# key: same result set, but the Overpass planner walks a single sub-query per
+# class and the POST body shrinks accordingly.
 TAG_QUERIES = {
     "points": [
-        'node["amenity"]',
-        'node["shop"]',
-        'node["man_made"]',
-        'node["tourism"]',            # e.g., tourism=viewpoint
-        'node["seamark:type"]',
-        'node[~"^seamark:.*"~".*"]',  # any seamark:* node
+        # amenity/shop/man_made/tourism (e.g., tourism=viewpoint) + any seamark:*
+        'node[~"^(amenity|shop|man_made|tourism|seamark:.*)$"~"."]',
     ],
     "lines": [
-        'way["highway"]',
-        'way["railway"]',
-        'way["waterway"]',
+        'way[~"^(highway|railway|waterway)$"~"."]',
     ],
     "polys": [
-        'way["building"]',
-        'way["landuse"]',
-        'way["natural"]',
-        'way["water"]',
+        'way[~"^(building|landuse|natural|water)$"~"."]',
     ],
     # Multipolygon relations that represent areas
+    # (amenity e.g. grave_yard; place e.g. island)
     "rel_polys": [
-        'relation["type"="multipolygon"]["building"]',
-        'relation["type"="multipolygon"]["landuse"]',
-        'relation["type"="multipolygon"]["natural"]',
-        'relation["type"="multipolygon"]["water"]',
-        'relation["type"="multipolygon"]["amenity"]',  # e.g., grave_yard
-        'relation["type"="multipolygon"]["place"]',    # e.g., island
+        'relation["type"="multipolygon"][~"^(building|landuse|natural|water|amenity|place)$"~"."]',
     ],
 }
 
@@ -86,6 +122,19 @@ TAG_QUERIES = {
 START_AOI = 3401   # inclusive
 END_AOI   = 3500   # inclusive; 0 = no upper limit
 
+# File-GDB commit batching: rows per implicit commit inside an edit session
+# (default is per-operation flushing; larger batches cost memory, save disk syncs)
+AUTO_COMMIT_ROWS = 1000
+
+# Tags storage: True + msgpack installed -> BLOB field with packed bytes
+# (smaller + faster to write). Off by default: the downstream stages assume a
+# JSON TEXT tags column — the SQL LIKE theme split, the NumPy column pull in
+# the inventory and FeaturesToJSON in the GeoJSON export all need text, and
+# only parse_tags understands the packed BLOB. Enable solely for runs whose
+# output is consumed by msgpack-aware tooling.
+USE_MSGPACK_TAGS = False
+_TAGS_AS_BLOB = bool(USE_MSGPACK_TAGS and msgpack is not None)
+
 # Final layer names inside the GDB
 LAYER_POINTS   = "osm_points"
 LAYER_LINES    = "osm_lines"
@@ -93,6 +142,19 @@ LAYER_POLYGONS = "osm_polygons"
 
 # -----------------------------------------------------------------------------
 
+# Shared singletons: arcpy object construction is not free, so build the WGS84
+# reference once per run and memoize Describe lookups per feature class.
+SR_WGS84 = arcpy.SpatialReference(4326)
+_SHAPETYPE_CACHE: Dict[str, str] = {}
+
+
+def shape_type(fc: str) -> str:
+    st = _SHAPETYPE_CACHE.get(fc)
+    if st is None:
+        st = arcpy.Describe(fc).shapeType.upper()
+        _SHAPETYPE_CACHE[fc] = st
+    return st
+
 
 def log(msg: str) -> None:
     sys.stdout.write(msg + "\n")
@@ -115,7 +177,10 @@ def _add_core_fields(fc: str) -> None:
             arcpy.AddField_management(fc, name, ftype, **kw)
 
     add("osmid",     "TEXT", field_length=32)
-    add("tags",      "TEXT", field_length=8000)  # bumped from 2000 → 8000
+    if _TAGS_AS_BLOB:
+        add("tags",  "BLOB")
+    else:
+        add("tags",  "TEXT", field_length=8000)  # bumped from 2000 → 8000
     add("elem_type", "TEXT", field_length=10)    # node | way | relation
     add("version",   "LONG")
     add("timestamp", "TEXT", field_length=30)
@@ -125,11 +190,10 @@ def _add_core_fields(fc: str) -> None:
 
 
 def create_fc(gdb: str, name: str, geom_type: str) -> str:
-    sr = arcpy.SpatialReference(4326)  # WGS84
     fc = os.path.join(gdb, name)
     if arcpy.Exists(fc):
         arcpy.management.Delete(fc)
-    arcpy.CreateFeatureclass_management(gdb, name, geom_type, spatial_reference=sr)
+    arcpy.CreateFeatureclass_management(gdb, name, geom_type, spatial_reference=SR_WGS84)
     _add_core_fields(fc)
     return fc
 
@@ -148,17 +212,17 @@ def bbox_of_geom(geom: arcpy.Geometry, pad: float) -> Tuple[float, float, float,
 
 
 def tiles_from_bbox(bbox: Tuple[float, float, float, float], step: float) -> List[Tuple[float, float, float, float]]:
+    """Tiles covering bbox, snapped to the global step grid. Snapping means
+    every AOI that touches a given tile asks for the exact same bbox, so
+    overlapping AOIs dedupe into cache hits instead of fresh fetches."""
     s, w, n, e = bbox
+    lat0, lat1 = math.floor(s / step), math.ceil(n / step)
+    lon0, lon1 = math.floor(w / step), math.ceil(e / step)
     tiles = []
-    lat = s
-    while lat < n:
-        next_lat = min(lat + step, n)
-        lon = w
-        while lon < e:
-            next_lon = min(lon + step, e)
-            tiles.append((lat, lon, next_lat, next_lon))
-            lon = next_lon
-        lat = next_lat
+    for li in range(lat0, lat1):
+        for lo in range(lon0, lon1):
+            tiles.append((round(li * step, 7), round(lo * step, 7),
+                          round((li + 1) * step, 7), round((lo + 1) * step, 7)))
     return tiles
 
 
@@ -203,55 +267,257 @@ out body geom;
     return ql
 
 
+def _make_session() -> requests.Session:
+    """One keep-alive session for the whole run: the TCP+TLS handshake is paid
+    once per pooled socket instead of once per tile."""
+    s = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=MAX_CONCURRENT_FETCHES,
+        pool_maxsize=MAX_CONCURRENT_FETCHES * 2,
+        max_retries=0,  # retries stay in fetch_tile_light where we control backoff
+    )
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+_SESSION = _make_session()
+
+
 def post_overpass(ql: str, timeout_sec: int) -> dict:
-    data = urllib.parse.urlencode({"data": ql}).encode("utf-8")
-    req = urllib.request.Request(OVERPASS_URL, data=data, method="POST")
-    req.add_header("Content-Type", "application/x-www-form-urlencoded")
-    with urllib.request.urlopen(req, timeout=timeout_sec) as resp:
-        raw = resp.read()
-    return json.loads(raw.decode("utf-8", errors="replace"))
+    stream = ijson is not None
+    resp = _SESSION.post(OVERPASS_URL, data={"data": ql},
+                         timeout=(10, timeout_sec), stream=stream)
+    resp.raise_for_status()
+    if not stream:
+        return resp.json()
+    # Parse elements incrementally off the socket: element dicts are built as
+    # bytes arrive instead of after a full resp.read() + json.loads round.
+    try:
+        resp.raw.decode_content = True
+        elements = list(ijson.items(resp.raw, "elements.item", use_float=True))
+        return {"elements": elements}
+    finally:
+        resp.close()
+
+
+_SLOTS_RE = re.compile(r"(\d+)\s+slots?\s+available", re.IGNORECASE)
+
+
+def _slots_available() -> Optional[int]:
+    """Ask the Overpass status endpoint how many query slots are free.
+    Returns None when the endpoint is unreachable or unparsable (treat as OK)."""
+    try:
+        resp = _SESSION.get(OVERPASS_STATUS_URL, timeout=(10, 15))
+        resp.raise_for_status()
+        m = _SLOTS_RE.search(resp.text)
+        return int(m.group(1)) if m else None
+    except Exception:
+        return None
+
+
+def wait_for_slot() -> None:
+    """Block until the server reports a free slot (or the status endpoint is
+    silent). Replaces the old unconditional SLEEP_BETWEEN_TILES pause."""
+    for _ in range(STATUS_POLL_MAX):
+        slots = _slots_available()
+        if slots is None or slots > 0:
+            return
+        time.sleep(STATUS_POLL_SEC)
+
+
+def _retry_delay(attempt: int, ex: Exception) -> float:
+    """Backoff for one failed attempt: honor Retry-After on 429/503, otherwise
+    exponential with jitter so parallel workers don't resync on the server."""
+    if isinstance(ex, requests.HTTPError) and ex.response is not None:
+        if ex.response.status_code in (429, 503):
+            ra = ex.response.headers.get("Retry-After", "")
+            if ra.strip().isdigit():
+                return min(float(ra), RETRY_MAX_DELAY * 2)
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+    return delay * (1 + random.uniform(0, 0.5))
+
+
+def _cache_path(ql: str) -> str:
+    # TILE_DEG is implicit in the bbox inside ql; CACHE_SCHEMA guards against
+    # parser/schema changes reusing stale payloads.
+    key = hashlib.sha1(f"{CACHE_SCHEMA}|{ql}".encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, key[:2], key + ".json.gz")
+
+
+def _cache_read(path: str) -> Optional[dict]:
+    if not os.path.isfile(path):
+        return None
+    try:
+        with gzip.open(path, "rb") as fh:
+            return json.loads(fh.read().decode("utf-8"))
+    except Exception as ex:
+        log(f"    cache read failed ({ex}); refetching")
+        return None
+
+
+def _cache_write(path: str, data: dict) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with gzip.open(tmp, "wb") as fh:
+            fh.write(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        os.replace(tmp, path)  # atomic: readers never see a partial file
+    except Exception as ex:
+        log(f"    cache write failed (non-fatal): {ex}")
 
 
 def fetch_tile_light(bbox: Tuple[float, float, float, float]) -> dict:
     ql = build_overpass_query_geom(TAG_QUERIES, bbox, OVERPASS_TIMEOUT)
-    backoff = 2.0
+    if CACHE_ENABLED:
+        cpath = _cache_path(ql)
+        cached = _cache_read(cpath)
+        if cached is not None:
+            return cached
+    # Only a real fetch needs an Overpass slot; polling /api/status before the
+    # cache lookup made fully-cached re-runs wait on the server per tile.
+    wait_for_slot()
     last_err = None
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            return post_overpass(ql, HTTP_TIMEOUT_SEC)
+            data = post_overpass(ql, HTTP_TIMEOUT_SEC)
+            if CACHE_ENABLED:
+                _cache_write(cpath, data)
+            return data
         except Exception as ex:
             last_err = ex
             log(f"Overpass transient (attempt {attempt}/{MAX_RETRIES}): {ex}")
-            time.sleep(backoff)
-            backoff *= 1.8
+            time.sleep(_retry_delay(attempt, ex))
     raise RuntimeError(f"Overpass failed after retries: {last_err}")
 
 
-def features_from_overpass(data: dict):
+def _fetch_one(tile: Tuple[float, float, float, float]):
+    """Worker-thread wrapper: never raises, returns (tile, data, error)."""
+    try:
+        data = fetch_tile_light(tile)
+        err: Optional[Exception] = None
+    except Exception as ex:
+        data, err = None, ex
+    return tile, data, err
+
+
+def fetch_tiles(tiles: List[Tuple[float, float, float, float]]):
+    """
+    Fetch tiles with a small thread pool (the loop is network-bound, not CPU-bound).
+    Yields (tile, data, error) as each download completes; callers do all arcpy
+    work on the main thread since cursors are not thread-safe.
+    """
+    workers = max(1, min(MAX_CONCURRENT_FETCHES, len(tiles)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_fetch_one, t) for t in tiles]
+        for fut in as_completed(futures):
+            yield fut.result()
+
+
+# --- WKB builders -------------------------------------------------------------
+# Emitting one little-endian WKB buffer per feature lets ArcPy assemble the
+# geometry in native code instead of one arcpy.Point per vertex.
+
+def _wkb_coords(coords) -> bytes:
+    flat = []
+    for x, y in coords:
+        flat.append(x)
+        flat.append(y)
+    return struct.pack("<%dd" % len(flat), *flat)
+
+
+def _wkb_point(x: float, y: float) -> bytes:
+    # byte order + POINT (1) + xy
+    return b"\x01" + struct.pack("<Idd", 1, x, y)
+
+
+def _wkb_polyline(coords) -> bytes:
+    # byte order + LINESTRING (2) + point count + xy pairs
+    return b"\x01" + struct.pack("<II", 2, len(coords)) + _wkb_coords(coords)
+
+
+def _wkb_polygon(outer, holes=()) -> bytes:
+    # byte order + POLYGON (3) + ring count, then each ring's count + xy pairs
+    rings = [outer] + list(holes)
+    parts = [b"\x01", struct.pack("<II", 3, len(rings))]
+    for ring in rings:
+        parts.append(struct.pack("<I", len(ring)))
+        parts.append(_wkb_coords(ring))
+    return b"".join(parts)
+
+
+# Keys whose presence marks a closed way / relation as an area feature.
+_AREA_KEYS = frozenset((
+    "building", "landuse", "amenity", "leisure", "natural", "water", "waterway", "place",
+))
+_AREA_YES = frozenset(("yes", "1", "true"))
+
+
+def is_area_tag(tags: dict) -> bool:
+    if not tags:
+        return False
+    return (str(tags.get("area", "")).lower() in _AREA_YES
+            or not _AREA_KEYS.isdisjoint(tags))
+
+
+def features_from_overpass(data: dict, aoi_extent: Optional[Tuple[float, float, float, float]] = None,
+                           drop_extent: Optional[Tuple[float, float, float, float]] = None):
     """
-    Parse Overpass JSON into three lists:
-      - pts:  [(arcpy.Geometry, osmid, tags_json, elem_type, version, timestamp, changeset, uid, user)]
-      - lns:  [(arcpy.Geometry, osmid, tags_json, elem_type, version, timestamp, changeset, uid, user)]
-      - pols: [(arcpy.Geometry, osmid, tags_json, elem_type, version, timestamp, changeset, uid, user)]
+    Parse Overpass JSON into three lists plus a straddle report:
+      - pts:  [(wkb_bytes, osmid, tags_json, elem_type, version, timestamp, changeset, uid, user)]
+      - lns:  [(wkb_bytes, osmid, tags_json, elem_type, version, timestamp, changeset, uid, user)]
+      - pols: [(wkb_bytes, osmid, tags_json, elem_type, version, timestamp, changeset, uid, user)]
+      - straddle: {"points"/"lines"/"polys": bool} — True when some kept
+        feature crosses the aoi_extent boundary and therefore needs Clip.
+    aoi_extent (s, w, n, e) is the exact AOI extent: only features fully
+    inside it count as 'in', so the pad strip around the AOI never skips
+    Clip. drop_extent (defaults to aoi_extent) may be wider — e.g. the
+    padded fetch bbox — and bounds what is dropped outright instead of
+    being staged and clipped away later.
+    Geometry stays as raw WKB all the way to the SHAPE@WKB insert — no arcpy
+    geometry objects are built per feature.
     Includes robust polygon detection and multipolygon assembly.
     """
-    sr = arcpy.SpatialReference(4326)
     pts, lns, pols = [], [], []
+    straddle = {"points": False, "lines": False, "polys": False}
     if not data or "elements" not in data:
-        return pts, lns, pols
+        return pts, lns, pols, straddle
+    if drop_extent is None:
+        drop_extent = aoi_extent
+
+    def extent_relation(coords):
+        """'out' (disjoint from drop_extent), 'in' (fully inside the AOI
+        extent) or 'edge'."""
+        if aoi_extent is None:
+            return "edge"  # unknown — keep and let Clip decide
+        minx = miny = float("inf")
+        maxx = maxy = float("-inf")
+        for x, y in coords:
+            if x < minx: minx = x
+            if x > maxx: maxx = x
+            if y < miny: miny = y
+            if y > maxy: maxy = y
+        ds, dw, dn, de = drop_extent
+        if maxx < dw or minx > de or maxy < ds or miny > dn:
+            return "out"
+        s, w, n, e = aoi_extent
+        if minx >= w and maxx <= e and miny >= s and maxy <= n:
+            return "in"
+        return "edge"
+
+    def point_inside(lon, lat):
+        if aoi_extent is None:
+            return True
+        s, w, n, e = aoi_extent
+        return w <= lon <= e and s <= lat <= n
 
     def tags_safestr(tags):
         try:
+            if _TAGS_AS_BLOB:
+                return msgpack.packb(tags or {}, use_bin_type=True)
             return json.dumps(tags or {}, ensure_ascii=False)  # no truncation
         except Exception:
-            return ""
-
-    def is_area_tag(tags: dict) -> bool:
-        if not tags:
-            return False
-        if str(tags.get("area", "")).lower() in ("yes", "1", "true"):
-            return True
-        return any(k in tags for k in ("building","landuse","amenity","leisure","natural","water","waterway","place"))
+            return b"" if _TAGS_AS_BLOB else ""
 
     def coords_closed(coords, eps=1e-9):
         if len(coords) < 4:
@@ -264,63 +530,76 @@ def features_from_overpass(data: dict):
         """
         ways_coords: list of coordinate lists for member ways.
         Returns list of closed rings (each a list of (x,y)).
-        Greedy endpoint stitching with reversal as needed.
+        Endpoint stitching with reversal as needed; fragments are indexed by
+        quantized endpoint so every extension is an O(1) dict lookup instead
+        of a rescan of all remaining fragments.
         """
         frags = [list(coords) for coords in ways_coords if len(coords) >= 2]
-        rings = []
         used = [False] * len(frags)
 
-        def try_close(chain):
-            return chain if coords_closed(chain) else None
+        def qkey(pt):
+            return (round(pt[0], 9), round(pt[1], 9))
+
+        start_idx = defaultdict(list)  # quantized start point -> fragment idxs
+        end_idx = defaultdict(list)    # quantized end point   -> fragment idxs
+        for i, f in enumerate(frags):
+            start_idx[qkey(f[0])].append(i)
+            end_idx[qkey(f[-1])].append(i)
 
+        def pop_unused(idx_map, key):
+            stack = idx_map.get(key)
+            while stack:
+                j = stack.pop()
+                if not used[j]:
+                    return j
+            return None
+
+        rings = []
         for i in range(len(frags)):
             if used[i]:
                 continue
             chain = frags[i][:]
             used[i] = True
-            extended = True
-            while extended:
-                extended = False
-                cs, ce = chain[0], chain[-1]
-                for j in range(len(frags)):
-                    if used[j]:
-                        continue
-                    w = frags[j]
-                    ws, we = w[0], w[-1]
-                    if ws == ce:
-                        chain.extend(w[1:])
-                        used[j] = True
-                        extended = True
-                    elif we == ce:
-                        chain.extend(list(reversed(w[:-1])))
-                        used[j] = True
-                        extended = True
-                    elif we == cs:
-                        chain = w[:-1] + chain
-                        used[j] = True
-                        extended = True
-                    elif ws == cs:
-                        chain = list(reversed(w[1:])) + chain
-                        used[j] = True
-                        extended = True
-            closed = try_close(chain)
-            if closed:
-                rings.append(closed)
+            while not (chain[0] == chain[-1] or coords_closed(chain)):
+                ce = qkey(chain[-1])
+                j = pop_unused(start_idx, ce)
+                if j is not None:
+                    used[j] = True
+                    chain.extend(frags[j][1:])
+                    continue
+                j = pop_unused(end_idx, ce)
+                if j is not None:
+                    used[j] = True
+                    chain.extend(list(reversed(frags[j][:-1])))
+                    continue
+                cs = qkey(chain[0])
+                j = pop_unused(end_idx, cs)
+                if j is not None:
+                    used[j] = True
+                    chain = frags[j][:-1] + chain
+                    continue
+                j = pop_unused(start_idx, cs)
+                if j is not None:
+                    used[j] = True
+                    chain = list(reversed(frags[j][1:])) + chain
+                    continue
+                break  # no fragment left that touches either open end
+            if coords_closed(chain):
+                rings.append(chain)
 
         return rings
 
-    # First pass: index nodes/ways; retain relations for later
-    nodes = {}  # id -> (lon,lat)
-    ways  = {}  # id -> {"tags":{}, "coords":[(x,y),...], "meta":{...}}
-    rels  = []  # multipolygon relations (keep full element for meta)
-
-    for el in data["elements"]:
-        if el.get("type") == "node" and "lon" in el and "lat" in el:
-            nodes[el["id"]] = (el["lon"], el["lat"])
-
-    for el in data["elements"]:
-        et = el.get("type"); eid = el.get("id"); tags = el.get("tags", {}) or {}
-        meta = {
+    # Single pass over elements. The query ends in "out body geom;", so ways
+    # normally carry inline geometry and the node index is only a fallback:
+    # geometry-less ways are deferred and resolved after the walk, instead of
+    # paying a second full iteration over the element list every tile.
+    nodes = {}     # id -> (lon,lat)
+    ways  = {}     # id -> {"tags":{}, "coords":[(x,y),...], "meta":{...}}
+    rels  = []     # multipolygon relations (keep full element for meta)
+    deferred = []  # way elements with no inline geometry
+
+    def meta_of(el):
+        return {
             "version": el.get("version"),
             "timestamp": el.get("timestamp"),
             "changeset": el.get("changeset"),
@@ -328,33 +607,68 @@ def features_from_overpass(data: dict):
             "user": el.get("user"),
         }
 
-        if et == "node":
-            # Keep only POIs (nodes with tags) as point features
-            if tags:
-                lon, lat = nodes.get(eid, (None, None))
-                if lon is not None and lat is not None:
-                    pts.append((
-                        arcpy.PointGeometry(arcpy.Point(lon, lat), sr),
-                        str(eid),
-                        tags_safestr(tags),
-                        "node",
-                        meta["version"], meta["timestamp"], meta["changeset"], meta["uid"], meta["user"]
-                    ))
-
-        elif et == "way":
-            geom = el.get("geometry")
-            if geom:
-                coords = [(p["lon"], p["lat"]) for p in geom if "lon" in p and "lat" in p]
-            else:
-                nds = el.get("nodes") or []
-                coords = [nodes[n] for n in nds if n in nodes]
-            if len(coords) >= 2:
-                ways[eid] = {"tags": tags, "coords": coords, "meta": meta}
+    def handle_node(el):
+        lon, lat = el.get("lon"), el.get("lat")
+        if lon is None or lat is None:
+            return
+        nodes[el["id"]] = (lon, lat)
+        # Keep only POIs (nodes with tags) as point features
+        tags = el.get("tags") or {}
+        if tags and point_inside(lon, lat):
+            meta = meta_of(el)
+            pts.append((
+                _wkb_point(lon, lat),
+                str(el.get("id")),
+                tags_safestr(tags),
+                "node",
+                meta["version"], meta["timestamp"], meta["changeset"], meta["uid"], meta["user"]
+            ))
+
+    def handle_way(el):
+        geom = el.get("geometry")
+        if not geom:
+            if el.get("nodes"):
+                deferred.append(el)
+            return
+        coords = [(p["lon"], p["lat"]) for p in geom if "lon" in p and "lat" in p]
+        if len(coords) >= 2:
+            ways[el.get("id")] = {"tags": el.get("tags") or {}, "coords": coords, "meta": meta_of(el)}
+
+    def handle_relation(el):
+        tags = el.get("tags") or {}
+        if tags.get("type") == "multipolygon" and is_area_tag(tags):
+            el["_meta"] = meta_of(el)
+            rels.append(el)
+
+    handlers = {"node": handle_node, "way": handle_way, "relation": handle_relation}
 
-        elif et == "relation":
-            if (el.get("tags", {}) or {}).get("type") == "multipolygon" and is_area_tag(el.get("tags", {}) or {}):
-                el["_meta"] = meta
-                rels.append(el)
+    for el in data["elements"]:
+        h = handlers.get(el.get("type"))
+        if h is not None:
+            h(el)
+
+    # Fallback: resolve ways that arrived without inline geometry against a
+    # sorted-array view of the node index (one searchsorted call per way
+    # instead of two dict lookups per vertex).
+    if deferred:
+        if nodes:
+            node_ids = np.fromiter(nodes.keys(), dtype=np.int64, count=len(nodes))
+            node_xy = np.array(list(nodes.values()), dtype=np.float64)
+            order = np.argsort(node_ids)
+            node_ids, node_xy = node_ids[order], node_xy[order]
+        else:
+            node_ids = np.empty(0, dtype=np.int64)
+            node_xy = np.empty((0, 2), dtype=np.float64)
+
+        for el in deferred:
+            arr = np.asarray(el["nodes"], dtype=np.int64)
+            idx = np.searchsorted(node_ids, arr)
+            valid = idx < node_ids.size
+            idx = np.where(valid, idx, 0)
+            valid &= node_ids[idx] == arr
+            coords = [tuple(p) for p in node_xy[idx[valid]]]
+            if len(coords) >= 2:
+                ways[el.get("id")] = {"tags": el.get("tags") or {}, "coords": coords, "meta": meta_of(el)}
 
     # Standalone ways → lines or polygons
     for wid, w in ways.items():
@@ -363,16 +677,19 @@ def features_from_overpass(data: dict):
             continue
         t = w["tags"]
         m = w["meta"]
+        where = extent_relation(coords)
+        if where == "out":
+            continue
         is_closed = len(coords) >= 4 and (coords[0] == coords[-1] or coords_closed(coords))
         if is_closed and is_area_tag(t):
-            ring = arcpy.Array([arcpy.Point(x, y) for (x, y) in coords])
-            pg = arcpy.Polygon(arcpy.Array([ring]), sr)
-            pols.append((pg, str(wid), tags_safestr(t), "way",
+            if where == "edge":
+                straddle["polys"] = True
+            pols.append((_wkb_polygon(coords), str(wid), tags_safestr(t), "way",
                          m["version"], m["timestamp"], m["changeset"], m["uid"], m["user"]))
         else:
-            arr = arcpy.Array([arcpy.Point(x, y) for (x, y) in coords])
-            ln = arcpy.Polyline(arr, sr)
-            lns.append((ln, str(wid), tags_safestr(t), "way",
+            if where == "edge":
+                straddle["lines"] = True
+            lns.append((_wkb_polyline(coords), str(wid), tags_safestr(t), "way",
                         m["version"], m["timestamp"], m["changeset"], m["uid"], m["user"]))
 
     # Multipolygon relations → stitched polygons (with holes)
@@ -409,23 +726,28 @@ def features_from_overpass(data: dict):
         if not outer_rings:
             continue
 
-        hole_arrays = [arcpy.Array([arcpy.Point(x, y) for (x, y) in ring]) for ring in inner_rings]
         for outer in outer_rings:
-            outer_arr = arcpy.Array([arcpy.Point(x, y) for (x, y) in outer])
-            # ArcPy polygon with holes = first array is the outer ring, then inner rings
-            pg = arcpy.Polygon(arcpy.Array([outer_arr] + hole_arrays if hole_arrays else [outer_arr]), sr)
-            pols.append((pg, str(rel.get("id")), tags_safestr(merged_tags), "relation",
+            where = extent_relation(outer)
+            if where == "out":
+                continue
+            if where == "edge":
+                straddle["polys"] = True
+            # WKB polygon with holes = first ring is the outer ring, then inner rings
+            pols.append((_wkb_polygon(outer, inner_rings),
+                         str(rel.get("id")), tags_safestr(merged_tags), "relation",
                          rmeta.get("version"), rmeta.get("timestamp"), rmeta.get("changeset"),
                          rmeta.get("uid"), rmeta.get("user")))
 
-    return pts, lns, pols
+    return pts, lns, pols, straddle
 
 
-def insert_rows(fc: str, rows: List[Tuple[arcpy.Geometry, str, str, str, int, str, int, int, str]]) -> None:
+def insert_rows(fc: str, rows: List[Tuple[bytes, str, str, str, int, str, int, int, str]]) -> None:
     if not rows:
         return
     append_fields_if_missing(fc)
-    fields = ["SHAPE@", "osmid", "tags", "elem_type", "version", "timestamp", "changeset", "uid", "user"]
+    # SHAPE@WKB lets the cursor consume the packed buffers directly; the
+    # geodatabase decodes WKB natively, skipping arcpy geometry objects.
+    fields = ["SHAPE@WKB", "osmid", "tags", "elem_type", "version", "timestamp", "changeset", "uid", "user"]
     with arcpy.da.InsertCursor(fc, fields) as cur:
         for r in rows:
             # ensure tuple is the right length (fill Nones if needed)
@@ -434,14 +756,21 @@ def insert_rows(fc: str, rows: List[Tuple[arcpy.Geometry, str, str, str, int, st
             cur.insertRow(r)
 
 
-def clip_append(raw_fc: str, aoi_fc: str, final_fc: str) -> None:
-    """Clip raw features to AOI geometry then append to final."""
+def clip_append(raw_fc: str, aoi_fc: str, final_fc: str, run_clip: bool = True) -> None:
+    """Clip raw features to AOI geometry then append to final. run_clip=False
+    (rectangular AOIs, no boundary-straddling features) appends directly and
+    skips the Clip tool invocation entirely."""
+    if not run_clip:
+        if not arcpy.Exists(final_fc):
+            create_fc(os.path.dirname(final_fc), os.path.basename(final_fc), shape_type(raw_fc))
+        append_fields_if_missing(final_fc)
+        arcpy.management.Append(raw_fc, final_fc, "NO_TEST")
+        return
     tmp = arcpy.CreateUniqueName(os.path.basename(raw_fc) + "_clip", "in_memory")
     try:
         arcpy.analysis.Clip(raw_fc, aoi_fc, tmp)
         if not arcpy.Exists(final_fc):
-            geom_type = arcpy.Describe(raw_fc).shapeType.upper()
-            create_fc(os.path.dirname(final_fc), os.path.basename(final_fc), geom_type)
+            create_fc(os.path.dirname(final_fc), os.path.basename(final_fc), shape_type(raw_fc))
         append_fields_if_missing(final_fc)
         arcpy.management.Append(tmp, final_fc, "NO_TEST")
     finally:
@@ -452,6 +781,7 @@ def clip_append(raw_fc: str, aoi_fc: str, final_fc: str) -> None:
 def main():
     log(f"Overpass: {OVERPASS_URL}")
     ensure_gdb(OUTPUT_GDB)
+    arcpy.env.autoCommit = AUTO_COMMIT_ROWS
 
     # Ensure final layers
     out_pts = os.path.join(OUTPUT_GDB, LAYER_POINTS)
@@ -471,14 +801,38 @@ def main():
     raw_pts, raw_lns, raw_pol = new_raw()
 
     # Prep AOIs in WGS84 + explode to single parts
-    sr_wgs84 = arcpy.SpatialReference(4326)
     aoi_4326 = arcpy.CreateUniqueName("aoi_4326", "in_memory")
     aoi_parts = arcpy.CreateUniqueName("aoi_parts", "in_memory")
 
     log("Projecting AOIs to WGS84 & exploding to single parts…")
-    arcpy.management.Project(AOI_PATH, aoi_4326, sr_wgs84)
+    arcpy.management.Project(AOI_PATH, aoi_4326, SR_WGS84)
     arcpy.management.MultipartToSinglepart(aoi_4326, aoi_parts)
 
+    # Pre-compute the run's unique tile set. AOIs in the joined shapefile
+    # overlap, and grid-snapped tiling means they reference identical tiles —
+    # fetch each exactly once here and let the AOI loop hit the disk cache.
+    if CACHE_ENABLED:
+        unique_tiles, refs = set(), 0
+        with arcpy.da.SearchCursor(aoi_parts, ["SHAPE@"]) as rows:
+            for idx, (geom,) in enumerate(rows, start=1):
+                if idx < START_AOI:
+                    continue
+                if END_AOI and idx > END_AOI:
+                    break
+                tiles = tiles_from_bbox(bbox_of_geom(geom, BBOX_BUFFER_DEG), TILE_DEG)
+                if len(tiles) > MAX_TILES_PER_AOI:
+                    continue  # AOI will be skipped in the main loop too
+                refs += len(tiles)
+                unique_tiles.update(tiles)
+        if unique_tiles:
+            log(f"Prefetching {len(unique_tiles)} unique tile(s) "
+                f"({refs - len(unique_tiles)} duplicate references deduped)…")
+            for ti, (tile, data, err) in enumerate(fetch_tiles(sorted(unique_tiles)), start=1):
+                if err is not None:
+                    log(f"  prefetch {ti}/{len(unique_tiles)} failed (AOI loop will retry): {err}")
+                elif ti % 25 == 0 or ti == len(unique_tiles):
+                    log(f"  prefetch {ti}/{len(unique_tiles)}")
+
     # Cursor through AOIs with index-based selection window
     with arcpy.da.SearchCursor(aoi_parts, ["OID@", "SHAPE@"]) as rows:
         for idx, (oid, geom) in enumerate(rows, start=1):
@@ -491,7 +845,12 @@ def main():
             aoi_fc = arcpy.CreateUniqueName(f"aoi_part_{oid}", "in_memory")
             arcpy.management.CopyFeatures([geom], aoi_fc)
 
+            # Padded bbox for fetching (tiles must cover a bit past the AOI so
+            # edge features arrive whole); unpadded extent for classification,
+            # or features living only in the pad strip would count as 'in' and
+            # let TRUST_AOI_EXTENT skip the Clip that removes them.
             bbox = bbox_of_geom(geom, BBOX_BUFFER_DEG)
+            aoi_bbox = bbox_of_geom(geom, 0.0)
             tiles = tiles_from_bbox(bbox, TILE_DEG)
             log(f"AOI index {idx} (OID {oid}): bbox {bbox} → {len(tiles)} tile(s)")
 
@@ -500,29 +859,50 @@ def main():
                 if arcpy.Exists(aoi_fc): arcpy.management.Delete(aoi_fc)
                 continue
 
-            # Process tiles
-            for ti, tile in enumerate(tiles, start=1):
-                log(f"  AOI {oid} | tile {ti}/{len(tiles)}: {tile}")
-                try:
-                    data = fetch_tile_light(tile)
-                except Exception as ex:
-                    log(f"    Tile failed (skipping): {ex}")
-                    continue
-
-                pts, lns, pols = features_from_overpass(data)
-                log(f"    parsed: {len(pts)} pts, {len(lns)} lines, {len(pols)} polys")
-                insert_rows(raw_pts, pts)
-                insert_rows(raw_lns, lns)
-                insert_rows(raw_pol, pols)
-
-                time.sleep(SLEEP_BETWEEN_TILES)
+            # Process tiles (downloads overlap; parse + insert stay on this thread).
+            # One edit session spans every tile of the AOI: the three cursor
+            # opens per tile share one operation instead of one implicit
+            # transaction (index sync + flush) each.
+            # Explicit start/stop (not the Editor context manager, which opens
+            # its own operation on enter and would double-start the first one)
+            needs_clip = {"points": False, "lines": False, "polys": False}
+            edit = arcpy.da.Editor(OUTPUT_GDB)
+            edit.startEditing(False, False)
+            try:
+                for ti, (tile, data, err) in enumerate(fetch_tiles(tiles), start=1):
+                    log(f"  AOI {oid} | tile {ti}/{len(tiles)}: {tile}")
+                    if err is not None:
+                        log(f"    Tile failed (skipping): {err}")
+                        continue
 
-            # Clip raw to this AOI and append to finals
+                    pts, lns, pols, straddle = features_from_overpass(
+                        data, aoi_extent=aoi_bbox, drop_extent=bbox)
+                    log(f"    parsed: {len(pts)} pts, {len(lns)} lines, {len(pols)} polys")
+                    edit.startOperation()
+                    insert_rows(raw_pts, pts)
+                    insert_rows(raw_lns, lns)
+                    insert_rows(raw_pol, pols)
+                    edit.stopOperation()
+                    for k in needs_clip:
+                        needs_clip[k] = needs_clip[k] or straddle[k]
+                edit.stopEditing(True)
+            except Exception:
+                if edit.isEditing:
+                    edit.abortOperation()
+                    edit.stopEditing(False)
+                raise
+
+            # Clip raw to this AOI and append to finals. With rectangular AOIs
+            # (TRUST_AOI_EXTENT), categories whose features all landed fully
+            # inside the extent skip the Clip tool and append directly.
             log(f"  AOI {oid}: clipping accumulators to this AOI and appending…")
             try:
-                clip_append(raw_pts, aoi_fc, out_pts)
-                clip_append(raw_lns, aoi_fc, out_lns)
-                clip_append(raw_pol, aoi_fc, out_pol)
+                clip_append(raw_pts, aoi_fc, out_pts,
+                            run_clip=not TRUST_AOI_EXTENT or needs_clip["points"])
+                clip_append(raw_lns, aoi_fc, out_lns,
+                            run_clip=not TRUST_AOI_EXTENT or needs_clip["lines"])
+                clip_append(raw_pol, aoi_fc, out_pol,
+                            run_clip=not TRUST_AOI_EXTENT or needs_clip["polys"])
             except Exception as ex:
                 log(f"  AOI {oid}: clip/append error: {ex}")
 
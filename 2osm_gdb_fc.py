@@ -7,10 +7,13 @@ Also reuses existing FCs on re-runs instead of recreating them.
 
 import os
 import re
-import json
-import ast
+import functools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import arcpy
 
+from osm_fast import classify_themes, init_themes, parse_tags
+
 # ---------------- CONFIG ----------------
 SOURCE_GDB    = r"C:\Users\name\Desktop\osm_batches\osm_clipped100.gdb"
 POINTS_FC     = "osm_points"
@@ -28,6 +31,22 @@ OUT_ROOT      = r"C:\Users\name\Desktop\osm_batches\osm_fc100.gdb"
 # Limit safety
 MAX_FCS_PER_LAYER = 64
 
+# Split LIKE-expressible themes engine-side (MakeFeatureLayer + CopyFeatures)
+# instead of row-by-row in Python; only themes with key_values rules still go
+# through the per-row classifier.
+USE_SQL_THEME_SPLIT = True
+
+# Theme the three layers in parallel worker processes, each writing to its own
+# scratch GDB (separate GDBs avoid File-GDB write locks; arcpy is process-safe
+# but not thread-safe), then merge into the final container.
+PARALLEL_LAYERS = True
+
+# "split"  -> one FC per theme; a feature matching K themes is written K times.
+# "tagged" -> each feature is written exactly once to <alias>_all with a
+#             'themes' text field listing its themes (semicolon-separated);
+#             per-theme subsets can then be pulled with definition queries.
+MULTI_THEME_MODE = "split"
+
 # ---------------- THEMES (edit as needed) ----------------
 THEMES = {
     "Transportation_Roads": {
@@ -109,8 +128,17 @@ THEMES = {
 FALLBACK_THEME = "Unclassified"
 # ---------------------------------------------------------
 
+# Build the inverted classification indexes in osm_fast (the per-row hot path
+# lives there so it can be AOT-compiled; see osm_fast.py / setup.py)
+init_themes(THEMES, FALLBACK_THEME)
+
 arcpy.env.overwriteOutput = True
 
+# The split is File-GDB write-bound, not CPU-bound: commits/journal flushes
+# dominate. Batch them coarsely; the Editor session + long-lived InsertCursors
+# in split_layer_by_themes handle the per-row transaction cost.
+arcpy.env.autoCommit = 50000
+
 def log(msg): print(msg)
 
 def ensure_dir(p):
@@ -145,39 +173,6 @@ def detect_tag_field(fc):
             return existing[cand.lower()]
     return None
 
-def parse_tags(raw):
-    if raw is None: return {}
-    txt = str(raw).strip()
-    if not txt or txt.lower() in ("null","none","nan"): return {}
-    # JSON
-    try:
-        obj = json.loads(txt)
-        if isinstance(obj, dict):
-            return {str(k): ("" if v is None else str(v)) for k, v in obj.items()}
-    except Exception:
-        pass
-    # Python dict literal
-    try:
-        obj = ast.literal_eval(txt)
-        if isinstance(obj, dict):
-            return {str(k): ("" if v is None else str(v)) for k, v in obj.items()}
-    except Exception:
-        pass
-    # Delimited fallback
-    out = {}
-    for t in re.split(r"[;,]\s*", txt):
-        if not t: continue
-        if "=" in t:
-            k, v = t.split("=", 1)
-        elif ":" in t and "://" not in t:
-            k, v = t.split(":", 1)
-        else:
-            k, v = t, "true"
-        k = k.strip()
-        v = "" if v is None else str(v).strip()
-        if k: out[k] = v
-    return out
-
 def field_list_for_cursor(fc):
     keep = []
     for f in arcpy.ListFields(fc):
@@ -205,30 +200,45 @@ def clone_schema(container, out_name, template_fc):
     )
     return out_path
 
-def classify_themes(tag_dict):
-    found = set()
-    keys = set(tag_dict.keys())
-    for theme, rule in THEMES.items():
-        if any(k in keys for k in rule.get("keys_any", [])):
-            found.add(theme); continue
-        kp = rule.get("key_prefixes", [])
-        if kp and any(any(k.startswith(pfx) for pfx in kp) for k in keys):
-            found.add(theme); continue
-        kv = rule.get("key_values", {})
-        hit = False
-        for k, allowed in kv.items():
-            if k in tag_dict:
-                val = str(tag_dict.get(k, ""))
-                if isinstance(allowed, (set, list, tuple)):
-                    if val in set(map(str, allowed)):
-                        hit = True; break
-                elif allowed == "*":
-                    hit = True; break
-        if hit:
-            found.add(theme); continue
-    if not found:
-        found.add(FALLBACK_THEME)
-    return found
+def ensure_themes_field(fc_path):
+    if not any(f.name == "themes" for f in arcpy.ListFields(fc_path)):
+        arcpy.management.AddField(fc_path, "themes", "TEXT", field_length=512)
+    return fc_path
+
+def theme_like_literals(rule):
+    """Literal substrings (the bodies of LIKE '%...%' tests) for a theme whose
+    rules are plain key presence / key prefix checks, or None when it has
+    key_values rules that a substring test cannot express. Keys are anchored
+    as '\"k\":' so tag *values* (e.g. railway=station) never match a keys_any
+    pattern."""
+    if rule.get("key_values"):
+        return None
+    lits = ['"{}":'.format(k) for k in rule.get("keys_any", [])]
+    lits += ['"{}'.format(p) for p in rule.get("key_prefixes", [])]
+    return lits or None
+
+def theme_where_clause(rule, tag_field):
+    """Compound LIKE expression for a theme, or None (see theme_like_literals)."""
+    lits = theme_like_literals(rule)
+    if not lits:
+        return None
+    return " OR ".join("{} LIKE '%{}%'".format(tag_field, lit) for lit in lits)
+
+def workspace_of(container):
+    """GDB that owns a container (the container itself, or the parent GDB of a
+    feature dataset)."""
+    return container if is_gdb(container) else os.path.dirname(container)
+
+@functools.lru_cache(maxsize=200_000)
+def _classify_raw(raw):
+    """Themes for one raw tags cell. OSM extracts repeat the same tags string
+    constantly (every plain residential road, every bare building, ...), so
+    memoizing on the cell skips both parse_tags and classify_themes for the
+    repeats — hit rates on real extracts are well above 90%."""
+    td = parse_tags(raw)
+    if not td:
+        return frozenset((FALLBACK_THEME,))
+    return frozenset(classify_themes(td))
 
 def split_layer_by_themes(src_fc, out_container, layer_alias, single_gdb_mode):
     tag_field = detect_tag_field(src_fc)
@@ -241,46 +251,174 @@ def split_layer_by_themes(src_fc, out_container, layer_alias, single_gdb_mode):
     write_fields = field_list_for_cursor(src_fc)
     tags_idx = read_fields.index(tag_field)
 
-    total = int(arcpy.management.GetCount(src_fc)[0])
-    log(f"   Features: {total} (tags='{tag_field}')")
-
-    out_fc_paths = {}  # theme_name_with_prefix -> path
-    created = 0
-
-    with arcpy.da.SearchCursor(src_fc, read_fields) as sc:
-        for i, row in enumerate(sc, start=1):
-            geom  = row[0]
-            attrs = row[1:len(write_fields)]
-            td    = parse_tags(row[tags_idx])
+    # No GetCount here: that is a full table scan in File GDB just to print a
+    # denominator, so the row count is tallied by the SearchCursor pass itself.
+    log(f"   Scanning features (tags='{tag_field}')")
 
-            cats = classify_themes(td) if td else {FALLBACK_THEME}
+    out_fc_paths = {}    # theme_name_with_prefix -> path
+    out_cursors = {}     # theme_name_with_prefix -> long-lived InsertCursor
 
-            for theme in cats:
-                # IMPORTANT: in a single .gdb, feature class names must be unique across the GDB.
-                # Prefix with the layer alias to avoid collisions: e.g., points_Water_Maritime
-                base_name = theme
-                fc_name = f"{layer_alias}_{base_name}" if single_gdb_mode else base_name
-                fc_name = sanitize_name(fc_name)
+    # Bulk phase: themes expressible as LIKE tests on the tags string are
+    # copied out in one engine-side CopyFeatures each; the row loop below then
+    # only has to write the residual themes.
+    tagged_mode = MULTI_THEME_MODE == "tagged"
+    tagged_fc_name = sanitize_name(f"{layer_alias}_all")
 
-                if fc_name not in out_fc_paths:
-                    if len(out_fc_paths) >= MAX_FCS_PER_LAYER:
-                        raise RuntimeError(
-                            f"Exceeded MAX_FCS_PER_LAYER={MAX_FCS_PER_LAYER}. "
-                            f"Increase the limit or reduce THEMES."
-                        )
-                    path = clone_schema(out_container, fc_name, src_fc)
-                    out_fc_paths[fc_name] = path
-                    created += 1
-
-                ic = arcpy.da.InsertCursor(out_fc_paths[fc_name], write_fields)
-                ic.insertRow((geom,) + tuple(attrs))
-                del ic
-
-            if i % 5000 == 0:
-                log(f"   ... processed {i}/{total}")
+    # FC names come from a small static set, so sanitize once per layer
+    # instead of paying a regex sub per feature/theme pair in the loop
+    name_by_theme = {
+        t: sanitize_name(f"{layer_alias}_{t}" if single_gdb_mode else t)
+        for t in list(THEMES) + [FALLBACK_THEME]
+    }
 
-    log(f"   Created {created} themed FCs under {out_container}")
-    return created
+    sql_themes = frozenset()
+    sql_literals = {}  # theme -> LIKE literals, re-tested per row below
+    if USE_SQL_THEME_SPLIT and not tagged_mode:
+        done = set()
+        for theme, rule in THEMES.items():
+            where = theme_where_clause(rule, tag_field)
+            if not where:
+                continue
+            sql_literals[theme] = theme_like_literals(rule)
+            fc_name = name_by_theme[theme]
+            out_path = os.path.join(out_container, fc_name)
+            lyr = "theme_sql_lyr"
+            arcpy.management.MakeFeatureLayer(src_fc, lyr, where)
+            arcpy.management.CopyFeatures(lyr, out_path)
+            arcpy.management.Delete(lyr)
+            if int(arcpy.management.GetCount(out_path)[0]) == 0:
+                arcpy.management.Delete(out_path)  # keep behaviour: no empty FCs
+            else:
+                out_fc_paths[fc_name] = out_path
+            done.add(theme)
+        sql_themes = frozenset(done)
+        log(f"   SQL split handled {len(sql_themes)} themes; scanning rows for the rest.")
+
+    # All schema work (CreateFeatureclass / AddField) happens here, before the
+    # edit session opens: File GDB rejects schema changes on a workspace with
+    # an active edit session. The FC names are known up front, so pre-create
+    # everything the row loop might write to and keep only the InsertCursor
+    # creation lazy. SQL-handled themes stay in the list because cells the
+    # LIKE tests cannot see (Python literals, "k=v;") still reach the cursor
+    # path for those themes.
+    if tagged_mode:
+        residual_names = [tagged_fc_name]
+    else:
+        residual_names = [name_by_theme[t] for t in list(THEMES) + [FALLBACK_THEME]]
+    if len(set(out_fc_paths) | set(residual_names)) > MAX_FCS_PER_LAYER:
+        raise RuntimeError(
+            f"Exceeded MAX_FCS_PER_LAYER={MAX_FCS_PER_LAYER}. "
+            f"Increase the limit or reduce THEMES."
+        )
+    fresh = set()  # pre-created here; deleted again below if no row lands
+    for fc_name in residual_names:
+        if not arcpy.Exists(os.path.join(out_container, fc_name)):
+            fresh.add(fc_name)
+        path = clone_schema(out_container, fc_name, src_fc)
+        if tagged_mode:
+            ensure_themes_field(path)
+        out_fc_paths[fc_name] = path
+
+    # One edit session (no undo stack, single user) for the whole write phase:
+    # the old loop re-created an InsertCursor per feature/theme pair, so cursor
+    # setup + per-insert transactions dominated runtime.
+    edit = arcpy.da.Editor(workspace_of(out_container))
+    edit.startEditing(False, False)
+    edit.startOperation()
+    try:
+        with arcpy.da.SearchCursor(src_fc, read_fields) as sc:
+            for i, row in enumerate(sc, start=1):
+                # Build the output row once; a feature matching several themes
+                # used to pay the tuple construction per theme.
+                out_row = (row[0],) + tuple(row[1:len(write_fields)])
+
+                raw_tags = row[tags_idx]
+                cats = _classify_raw(raw_tags)
+                if sql_themes:
+                    # Subtract only themes whose LIKE literals actually match
+                    # this cell: that is exactly the set the SQL phase copied.
+                    # Python-literal and "k=v;" cells contain no '"key":'
+                    # substring, so they keep flowing through this cursor path
+                    # instead of being dropped.
+                    if isinstance(raw_tags, str):
+                        cats -= {t for t in (cats & sql_themes)
+                                 if any(lit in raw_tags for lit in sql_literals[t])}
+                    if not cats:
+                        continue
+
+                if tagged_mode:
+                    # Single write per feature; themes recorded as a field.
+                    fc_name = tagged_fc_name
+                    if fc_name not in out_cursors:
+                        out_cursors[fc_name] = arcpy.da.InsertCursor(
+                            out_fc_paths[fc_name], write_fields + ["themes"])
+                    out_cursors[fc_name].insertRow(out_row + (";".join(sorted(cats)),))
+                else:
+                    for theme in cats:
+                        # In a single .gdb, FC names must be unique across the
+                        # GDB; name_by_theme already carries the alias prefix
+                        # (e.g. points_Water_Maritime) in that mode.
+                        fc_name = name_by_theme[theme]
+
+                        if fc_name not in out_cursors:
+                            out_cursors[fc_name] = arcpy.da.InsertCursor(
+                                out_fc_paths[fc_name], write_fields)
+
+                        out_cursors[fc_name].insertRow(out_row)
+
+                if i % 5000 == 0:
+                    log(f"   ... processed {i}")
+        used = set(out_cursors)
+        out_cursors.clear()  # release cursors before closing the session
+        edit.stopOperation()
+        edit.stopEditing(True)
+    except Exception:
+        if edit.isEditing:
+            edit.abortOperation()
+            edit.stopEditing(False)
+        raise
+    finally:
+        out_cursors.clear()  # drop cursor references so the FCs unlock
+
+    # Pre-created FCs that never received a row get dropped again, keeping the
+    # old behaviour of never leaving empty FCs behind.
+    for fc_name in fresh - used:
+        arcpy.management.Delete(out_fc_paths.pop(fc_name))
+
+    log(f"   Created {len(out_fc_paths)} themed FCs under {out_container}")
+    return len(out_fc_paths)
+
+def _theme_layer_worker(src_fc, scratch_gdb, layer_alias, single_gdb_mode):
+    """Child-process entry: theme one layer into a fresh scratch GDB.
+
+    Must stay a picklable top-level function. single_gdb_mode only controls
+    the alias prefix on FC names so they already match the final container."""
+    folder, name = os.path.split(scratch_gdb)
+    if arcpy.Exists(scratch_gdb):
+        arcpy.management.Delete(scratch_gdb)
+    arcpy.management.CreateFileGDB(folder, name)
+    return split_layer_by_themes(src_fc, scratch_gdb, layer_alias, single_gdb_mode)
+
+def _merge_scratch(scratch_gdb, container):
+    """Move every themed FC from a worker's scratch GDB into the final
+    container (Append when the FC already exists there), then drop the
+    scratch."""
+    merged = 0
+    prev_ws = arcpy.env.workspace
+    arcpy.env.workspace = scratch_gdb
+    try:
+        for fc in (arcpy.ListFeatureClasses() or []):
+            src = os.path.join(scratch_gdb, fc)
+            dst = os.path.join(container, fc)
+            if arcpy.Exists(dst):
+                arcpy.management.Append(src, dst, "NO_TEST")
+            else:
+                arcpy.management.CopyFeatures(src, dst)
+            merged += 1
+    finally:
+        arcpy.env.workspace = prev_ws
+    arcpy.management.Delete(scratch_gdb)
+    return merged
 
 def main():
     if not arcpy.Exists(SOURCE_GDB):
@@ -323,11 +461,30 @@ def main():
             containers[lyr] = (gdb_path, layer_alias_map.get(lyr, sanitize_name(lyr.lower())))
 
     grand_total = 0
-    for lyr, (container, alias) in containers.items():
-        src_fc = os.path.join(SOURCE_GDB, lyr)
-        log(f"\n=== Theming layer: {src_fc}")
-        made = split_layer_by_themes(src_fc, container, alias, single_gdb)
-        grand_total += made
+    if PARALLEL_LAYERS and len(containers) > 1:
+        # The layers share nothing, so theme them in parallel processes. Each
+        # worker fills its own scratch GDB; merges happen here in the parent.
+        scratch_root = os.path.dirname(OUT_ROOT) if single_gdb else OUT_ROOT
+        futures = {}
+        with ProcessPoolExecutor(max_workers=min(3, len(containers))) as pool:
+            for lyr, (container, alias) in containers.items():
+                src_fc = os.path.join(SOURCE_GDB, lyr)
+                scratch = os.path.join(scratch_root, sanitize_name(f"_worker_{lyr}") + ".gdb")
+                log(f"=== Theming layer (worker): {src_fc}")
+                fut = pool.submit(_theme_layer_worker, src_fc, scratch, alias, single_gdb)
+                futures[fut] = (lyr, container, scratch)
+            for fut in as_completed(futures):
+                lyr, container, scratch = futures[fut]
+                made = fut.result()
+                merged = _merge_scratch(scratch, container)
+                log(f"=== {lyr}: worker produced {made} FCs, merged {merged} into {container}")
+                grand_total += made
+    else:
+        for lyr, (container, alias) in containers.items():
+            src_fc = os.path.join(SOURCE_GDB, lyr)
+            log(f"\n=== Theming layer: {src_fc}")
+            made = split_layer_by_themes(src_fc, container, alias, single_gdb)
+            grand_total += made
 
     log("\nDone.")
     log(f"Total themed FCs created: {grand_total}")
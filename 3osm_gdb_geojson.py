@@ -4,6 +4,11 @@ import re
 import json
 import csv
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # ============================
 #  CONFIGURATION
 # ============================
@@ -22,9 +27,13 @@ END_FID = 200
 #  HELPER FUNCTIONS
 # ============================
 
+# Compiled once; the capture group gives the FID number without a second pass
+_FID_RE = re.compile(r'^FID(\d+)$', re.IGNORECASE)
+
+
 def is_fid_folder(name):
     """Matches folders like FID0, FID1, FID600, etc."""
-    return re.match(r'^FID\d+$', name, re.IGNORECASE) is not None
+    return _FID_RE.match(name) is not None
 
 
 def ensure_folder(path):
@@ -34,6 +43,29 @@ def ensure_folder(path):
     return path
 
 
+# orjson (C parser/serializer, writes bytes directly) when available, stdlib
+# json otherwise — the conversion box may only have the stock ArcGIS Pro env
+
+def _load_json_file(path):
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _dump_json_file(path, data):
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(data))
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+
+_json_loads = json.loads if orjson is None else orjson.loads
+
+
 def validate_geojson(file_path):
     """Validate GeoJSON and return summary info."""
 
@@ -41,8 +73,7 @@ def validate_geojson(file_path):
         return ("MISSING", 0, "")
 
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = _load_json_file(file_path)
     except Exception:
         return ("INVALID_JSON", 0, "")
 
@@ -66,8 +97,14 @@ def validate_geojson(file_path):
     return ("OK", feature_count, geom_types_str)
 
 
-def write_validation_row(csv_path, layer, status, feature_count, geom_types):
-    """Append a validation row to CSV."""
+def flush_validation_rows(csv_path, rows):
+    """Append buffered validation rows to CSV in one open/write/close.
+
+    Rows used to be written one at a time, re-opening the report (on a share)
+    for every feature class; now the whole FID folder flushes at once."""
+    if not rows:
+        return
+
     new_file = not os.path.exists(csv_path)
 
     with open(csv_path, "a", newline="", encoding="utf-8") as f:
@@ -76,77 +113,106 @@ def write_validation_row(csv_path, layer, status, feature_count, geom_types):
         if new_file:  # Write header first time only
             writer.writerow(["layer", "status", "feature_count", "geometry_types"])
 
-        writer.writerow([layer, status, feature_count, geom_types])
+        writer.writerows(rows)
 
 
 # ============================
 #  NEW: TAG FIXER
 # ============================
 
-def fix_geojson_tags(path):
-    """Flatten the 'tags' string into individual fields and remove the original field."""
+def fix_and_validate_geojson(path):
+    """Flatten the 'tags' string into individual fields and collect the
+    validation stats in the same pass.
+
+    The old flow parsed the whole file for the tag fix, wrote it back, then
+    parsed it all over again just to count features — this does one load and
+    one (compact) dump. Returns (status, feature_count, geom_types_str)."""
+
+    if not os.path.exists(path):
+        return ("MISSING", 0, "")
+
+    # Cheap sniff: if no "tags" member shows up near the head of the file
+    # there is nothing to flatten, so skip the rewrite and just collect stats.
+    with open(path, "rb") as f:
+        if b'"tags"' not in f.read(65536):
+            return validate_geojson(path)
 
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except:
+        data = _load_json_file(path)
+    except Exception:
         print(f"      [ERROR] Could not load JSON for tag-fix: {path}")
-        return
+        return ("INVALID_JSON", 0, "")
 
     if data.get("type") != "FeatureCollection":
-        return
+        return ("NOT_FEATURE_COLLECTION", 0, "")
 
-    for feature in data.get("features", []):
+    features = data.get("features", [])
+    geom_types = set()
+
+    for feature in features:
         props = feature.get("properties", {})
 
         # If "tags" exists and is a JSON string...
         if "tags" in props and isinstance(props["tags"], str):
             try:
-                parsed_tags = json.loads(props["tags"])  # Convert string JSON → dict
-            except:
+                parsed_tags = _json_loads(props["tags"])  # Convert string JSON → dict
+            except Exception:
                 print("      [WARN] Failed to parse tags JSON, removing field")
                 del props["tags"]
-                continue
-
-            # Flatten: {"highway":"footway"} → tags_highway="footway"
-            for k, v in parsed_tags.items():
-                props[f"tags_{k}"] = v
-
-            # Remove original string JSON
-            del props["tags"]
+            else:
+                # Flatten: {"highway":"footway"} → tags_highway="footway"
+                for k, v in parsed_tags.items():
+                    props[f"tags_{k}"] = v
+                # Remove original string JSON
+                del props["tags"]
 
         feature["properties"] = props
 
-    # Write back the cleaned GeoJSON
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        geom = feature.get("geometry", {})
+        if geom and "type" in geom:
+            geom_types.add(geom["type"])
+
+    # Write back the cleaned GeoJSON. Compact output: GeoJSON consumers don't
+    # need pretty-printing, and indent=2 roughly doubled size and dump time.
+    _dump_json_file(path, data)
 
     print("      ✔ Tags flattened + cleaned (ArcGIS Pro compatible)")
 
+    geom_types_str = ",".join(sorted(geom_types))
+    if not features:
+        return ("EMPTY", 0, geom_types_str)
+    return ("OK", len(features), geom_types_str)
+
 
 # ============================
 #  CONVERSION FUNCTION
 # ============================
 
 def _convert_fc(workspace, fc, fid_folder_path):
-    """Convert one feature class to GeoJSON, fix tags, and run validation."""
+    """Convert one feature class to GeoJSON, fix tags, and run validation.
+    Returns the validation row for the caller to buffer."""
     in_fc_path = os.path.join(workspace, fc)
 
-    # GeoJSON and validation folders
     geojson_folder = ensure_folder(os.path.join(fid_folder_path, "geojson"))
-    validation_folder = ensure_folder(os.path.join(fid_folder_path, "validation"))
-    validation_csv = os.path.join(validation_folder, "validation_report.csv")
 
     out_geojson = os.path.join(geojson_folder, f"{fc}.geojson")
 
     print(f"    → Converting {in_fc_path}")
     print(f"      Output → {out_geojson}")
 
-    # Export to GeoJSON using correct ArcPy signature
+    # Only pay the tag-fix rewrite when the FC actually carries a tags field
+    has_tags = any(
+        f.name.lower() in ("tags", "other_tags", "osm_tags")
+        for f in arcpy.ListFields(in_fc_path)
+    )
+
+    # Export to GeoJSON using correct ArcPy signature.
+    # NOT_FORMATTED: pretty-printing roughly doubles the file size and every
+    # downstream JSON parse of it.
     arcpy.conversion.FeaturesToJSON(
         in_features=in_fc_path,
         out_json_file=out_geojson,
-        format_json="FORMATTED",
+        format_json="NOT_FORMATTED",
         include_z_values="NO_Z_VALUES",
         include_m_values="NO_M_VALUES",
         geoJSON="GEOJSON",
@@ -154,15 +220,17 @@ def _convert_fc(workspace, fc, fid_folder_path):
         use_field_alias="USE_FIELD_NAME"
     )
 
-    # === NEW: Fix the problematic "tags" property ===
-    fix_geojson_tags(out_geojson)
-
-    # Validate GeoJSON
-    status, feature_count, geom_types = validate_geojson(out_geojson)
-    write_validation_row(validation_csv, fc, status, feature_count, geom_types)
+    # Fix the problematic "tags" property and validate in the same pass
+    # (validation only when there is nothing to fix)
+    if has_tags:
+        status, feature_count, geom_types = fix_and_validate_geojson(out_geojson)
+    else:
+        status, feature_count, geom_types = validate_geojson(out_geojson)
 
     print(f"      VALIDATION → {status} ({feature_count} features, {geom_types})")
 
+    return [fc, status, feature_count, geom_types]
+
 
 # ============================
 #  PROCESS A SINGLE FID FOLDER
@@ -173,9 +241,13 @@ def convert_fgdb_to_geojson(fid_folder_path):
     print(f"\n[PROCESSING FID] {fid_folder_path}")
 
     ensure_folder(os.path.join(fid_folder_path, "geojson"))
-    ensure_folder(os.path.join(fid_folder_path, "validation"))
+    validation_folder = ensure_folder(os.path.join(fid_folder_path, "validation"))
+    validation_csv = os.path.join(validation_folder, "validation_report.csv")
+    validation_rows = []
 
-    gdbs = [d for d in os.listdir(fid_folder_path) if d.lower().endswith(".gdb")]
+    # scandir: one directory read, no extra stat per entry (matters on shares)
+    with os.scandir(fid_folder_path) as it:
+        gdbs = [e.name for e in it if e.name.lower().endswith(".gdb")]
     if not gdbs:
         print("  [INFO] No .gdb found.")
         return
@@ -191,7 +263,7 @@ def convert_fgdb_to_geojson(fid_folder_path):
         if root_fcs:
             print(f"  Root feature classes: {root_fcs}")
             for fc in root_fcs:
-                _convert_fc(arcpy.env.workspace, fc, fid_folder_path)
+                validation_rows.append(_convert_fc(arcpy.env.workspace, fc, fid_folder_path))
         else:
             print("  No root feature classes found.")
 
@@ -212,11 +284,14 @@ def convert_fgdb_to_geojson(fid_folder_path):
                     continue
 
                 for fc in fcs:
-                    _convert_fc(arcpy.env.workspace, fc, fid_folder_path)
+                    validation_rows.append(_convert_fc(arcpy.env.workspace, fc, fid_folder_path))
 
         else:
             print("  No feature datasets found.")
 
+    # One CSV open/write per FID folder instead of one per feature class
+    flush_validation_rows(validation_csv, validation_rows)
+
 
 # ============================
 #  MAIN PROGRAM
@@ -227,19 +302,21 @@ def main():
     print(f"Scanning: {BASE_DIR}")
     print(f"Processing batch range: FID{START_FID} to FID{END_FID}\n")
 
-    for folder in os.listdir(BASE_DIR):
-        folder_path = os.path.join(BASE_DIR, folder)
-
-        if os.path.isdir(folder_path) and is_fid_folder(folder):
+    # scandir avoids a stat per entry over the share, and the FID number comes
+    # straight from the regex capture group
+    with os.scandir(BASE_DIR) as it:
+        for entry in it:
+            m = _FID_RE.match(entry.name)
+            if m is None or not entry.is_dir():
+                continue
 
-            # Extract numeric part: FID123 → 123
-            fid_num = int(folder.replace("FID", ""))
+            fid_num = int(m.group(1))
 
             # Only process if inside user-selected range
             if START_FID <= fid_num <= END_FID:
-                convert_fgdb_to_geojson(folder_path)
+                convert_fgdb_to_geojson(entry.path)
             else:
-                print(f"[SKIPPED] {folder} (outside batch range)")
+                print(f"[SKIPPED] {entry.name} (outside batch range)")
 
     print("\n=== Conversion + Tag Fix + Validation Complete ===")
 
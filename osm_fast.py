@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+Per-row hot path shared by the theming / inventory scripts (2osm_gdb_fc,
+osm_tag): tag parsing and theme classification.
+
+Both functions here run once per OSM feature, so the module is written to be
+AOT-compiled with mypyc (see setup.py: `python setup.py build_ext --inplace`).
+The scripts import it the same way either way — without the built extension
+the pure-Python module is used.
+
+parse_tags() is called once per feature, and the overwhelmingly common cell is
+a flat, escape-free JSON dict of short ASCII strings. That case gets a
+specialized byte scanner that emits (key_start, key_len, val_start, val_len)
+offsets into a preallocated int32 array — JIT-compiled with Numba when it is
+installed — so the hot path never touches json.loads, ast.literal_eval or the
+regex fallback, and never uses exceptions as control flow. Anything the
+scanner cannot prove flat/ASCII falls back to the original parser ladder.
+
+classify_themes() dispatches to a function generated by init_themes() and
+specialized to the THEMES config: rules are inlined as literal membership
+tests, value sets and unrolled prefix checks. If codegen fails it falls back
+to inverted indexes (key -> themes, (key, value) -> themes, wildcard key ->
+themes, flat prefix table) — either way O(row keys) per feature instead of
+walking every theme rule.
+
+Dependencies: ArcGIS Pro / ArcPy environment only (Numba and mypyc optional).
+"""
+
+import re
+import json
+import ast
+from bisect import bisect_right
+from typing import Callable, Dict, FrozenSet, Optional, Set, Tuple
+
+try:
+    import numpy as _np
+    from numba import njit as _njit
+except ImportError:
+    _np = None
+    _njit = None
+
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+try:
+    import msgpack as _msgpack
+except ImportError:
+    _msgpack = None
+
+# orjson when available (C parser, several times faster on these small dicts),
+# stdlib otherwise; both raise ValueError subclasses on bad input
+_json_loads = json.loads if _orjson is None else _orjson.loads
+
+# Cells considered empty (checked lowercase)
+_NULL = frozenset(("null", "none", "nan"))
+
+# Delimiter for the "k=v;k2=v2" fallback, compiled once instead of hitting the
+# re module cache on every call
+_SPLIT_RE = re.compile(r"[;,]\s*")
+
+# Max key/value pairs the scanner can report per cell
+_SCAN_MAX_PAIRS = 512
+
+
+def _scan_flat_json_py(buf, out):
+    """Scan b'{"k":"v",...}' in buf (uint8 array) and write offset/length quads
+    into out (int32 array of 4*_SCAN_MAX_PAIRS). Returns the pair count, or -1
+    to request the slow path (escapes, nesting, non-string values, non-ASCII
+    bytes, or malformed input). Written njit-compatible: no sets, no slices."""
+    n = buf.shape[0]
+    i = 0
+    while i < n and (buf[i] == 32 or buf[i] == 9 or buf[i] == 10 or buf[i] == 13):
+        i += 1
+    if i >= n or buf[i] != 123:  # '{'
+        return -1
+    i += 1
+    count = 0
+    while True:
+        while i < n and (buf[i] == 32 or buf[i] == 9 or buf[i] == 10 or buf[i] == 13):
+            i += 1
+        if i >= n:
+            return -1
+        if buf[i] == 125:  # '}'
+            i += 1
+            while i < n:
+                if not (buf[i] == 32 or buf[i] == 9 or buf[i] == 10 or buf[i] == 13):
+                    return -1
+                i += 1
+            return count
+        if count > 0:
+            if buf[i] != 44:  # ','
+                return -1
+            i += 1
+            while i < n and (buf[i] == 32 or buf[i] == 9 or buf[i] == 10 or buf[i] == 13):
+                i += 1
+        if i >= n or buf[i] != 34:  # '"' opening key
+            return -1
+        i += 1
+        key_start = i
+        while i < n and buf[i] != 34:
+            if buf[i] == 92 or buf[i] >= 128:  # escape / non-ASCII
+                return -1
+            i += 1
+        if i >= n:
+            return -1
+        key_len = i - key_start
+        i += 1
+        while i < n and (buf[i] == 32 or buf[i] == 9 or buf[i] == 10 or buf[i] == 13):
+            i += 1
+        if i >= n or buf[i] != 58:  # ':'
+            return -1
+        i += 1
+        while i < n and (buf[i] == 32 or buf[i] == 9 or buf[i] == 10 or buf[i] == 13):
+            i += 1
+        if i >= n or buf[i] != 34:  # only string values on the fast path
+            return -1
+        i += 1
+        val_start = i
+        while i < n and buf[i] != 34:
+            if buf[i] == 92 or buf[i] >= 128:
+                return -1
+            i += 1
+        if i >= n:
+            return -1
+        val_len = i - val_start
+        i += 1
+        if count >= _SCAN_MAX_PAIRS:
+            return -1
+        base = count * 4
+        out[base] = key_start
+        out[base + 1] = key_len
+        out[base + 2] = val_start
+        out[base + 3] = val_len
+        count += 1
+
+
+if _njit is not None:
+    _scan_flat_json = _njit(cache=True)(_scan_flat_json_py)
+else:
+    _scan_flat_json = _scan_flat_json_py
+
+
+def _parse_flat_json(txt: str) -> Optional[Dict[str, str]]:
+    """Fast-path decode of a flat ASCII JSON dict. Returns the dict, or None
+    when the scanner bails (caller then runs the ladder). ASCII-only means the
+    byte offsets from the scanner are also character offsets into txt."""
+    try:
+        raw = txt.encode("ascii")
+    except UnicodeEncodeError:
+        return None
+    buf = _np.frombuffer(raw, dtype=_np.uint8)
+    out = _np.empty(_SCAN_MAX_PAIRS * 4, dtype=_np.int32)
+    n = _scan_flat_json(buf, out)
+    if n < 0:
+        return None
+    result: Dict[str, str] = {}
+    for i in range(n):
+        b = i * 4
+        ks, kl, vs, vl = int(out[b]), int(out[b + 1]), int(out[b + 2]), int(out[b + 3])
+        result[txt[ks:ks + kl]] = txt[vs:vs + vl]
+    return result
+
+
+def parse_tags(raw: object) -> Dict[str, str]:
+    """
+    Parse a tags cell into dict {key: value}.
+    Handles JSON, Python-literal dicts, and delimited "k=v;k2=v2" strings.
+    """
+    if raw is None or raw == "":
+        return {}
+    if isinstance(raw, dict):
+        # Already parsed (JSON field types, pandas-backed cursors): don't
+        # round-trip it through str() and a JSON parse
+        return {str(k): ("" if v is None else str(v)) for k, v in raw.items()}
+    if isinstance(raw, str):
+        txt = raw
+    elif isinstance(raw, (bytes, bytearray, memoryview)):
+        # BLOB cells: arcpy hands them back as memoryview, and the only BLOB
+        # writer in this pipeline packs msgpack — try that before assuming
+        # UTF-8 JSON text
+        buf = bytes(raw)
+        if _msgpack is not None:
+            try:
+                obj = _msgpack.unpackb(buf, raw=False)
+            except Exception:
+                pass
+            else:
+                if isinstance(obj, dict):
+                    return {str(k): ("" if v is None else str(v)) for k, v in obj.items()}
+        txt = buf.decode("utf-8", "ignore")
+    else:
+        txt = str(raw)
+    txt = txt.strip()
+    if not txt or (len(txt) <= 4 and txt.lower() in _NULL):
+        return {}
+
+    c0 = txt[0]
+
+    # Specialized flat-JSON scanner (the common case, by far)
+    if c0 == "{" and _njit is not None:
+        obj = _parse_flat_json(txt)
+        if obj is not None:
+            return obj
+
+    # Try JSON / Python-literal, but only when it can possibly be a dict —
+    # skipping the try/except entirely for plain "k=v;..." cells
+    if c0 == "{" or c0 == "[":
+        try:
+            obj = _json_loads(txt)
+            if isinstance(obj, dict):
+                return {str(k): ("" if v is None else str(v)) for k, v in obj.items()}
+        except Exception:
+            pass
+        try:
+            obj = ast.literal_eval(txt)
+            if isinstance(obj, dict):
+                return {str(k): ("" if v is None else str(v)) for k, v in obj.items()}
+        except Exception:
+            pass
+
+    # Fallback: delimited "k=v;k2=v2" or "k:v"
+    out: Dict[str, str] = {}
+    for t in _SPLIT_RE.split(txt):
+        if not t:
+            continue
+        if "=" in t:
+            k, v = t.split("=", 1)
+        elif ":" in t and "://" not in t:
+            k, v = t.split(":", 1)
+        else:
+            # bare key -> treat as boolean true
+            k, v = t, "true"
+        k = k.strip()
+        v = v.strip()
+        if k:
+            out[k] = v
+    return out
+
+
+# ---------------- Theme classification ----------------
+# Inverted indexes, populated by init_themes(). classify_themes costs
+# O(row keys) dict lookups per feature instead of walking every theme rule.
+
+_KEYS_ANY_INDEX: Dict[str, FrozenSet[str]] = {}       # key          -> themes
+_KEY_VALUES_INDEX: Dict[Tuple[str, str], FrozenSet[str]] = {}  # (key, value) -> themes
+_KEY_ANY_VALUE_INDEX: Dict[str, FrozenSet[str]] = {}  # key          -> themes ("*" wildcard rules)
+_PREFIX_INDEX: Dict[str, FrozenSet[str]] = {}         # prefix       -> themes
+_ALL_PREFIXES: Tuple[str, ...] = ()                   # sorted, for bisect
+_FALLBACK_THEME: str = "Unclassified"
+
+
+def _build_theme_indexes(themes: Dict[str, dict]):
+    keys_any: Dict[str, Set[str]] = {}
+    key_values: Dict[Tuple[str, str], Set[str]] = {}
+    key_any_value: Dict[str, Set[str]] = {}
+    prefix_map: Dict[str, Set[str]] = {}
+    for theme, rule in themes.items():
+        for k in rule.get("keys_any", []):
+            keys_any.setdefault(k, set()).add(theme)
+        for pfx in rule.get("key_prefixes", []):
+            prefix_map.setdefault(pfx, set()).add(theme)
+        for k, allowed in rule.get("key_values", {}).items():
+            if allowed == "*":
+                key_any_value.setdefault(k, set()).add(theme)
+            else:
+                for v in allowed:
+                    key_values.setdefault((k, str(v)), set()).add(theme)
+
+    def freeze(d):
+        return {k: frozenset(v) for k, v in d.items()}
+
+    return freeze(keys_any), freeze(key_values), freeze(key_any_value), freeze(prefix_map)
+
+
+def _codegen_classifier(themes: Dict[str, dict], fallback: str):
+    """Generate a classifier specialized to one THEMES config.
+
+    THEMES is static for the whole run, so instead of interpreting it per row
+    the rules are inlined into a generated function: key presence becomes
+    literal `in tag_dict` tests, key_values become one .get per key against
+    literal value sets, and prefixes become unrolled startswith checks. Each
+    row then pays straight dict lookups with no loops over the config."""
+    lines = ["def _classify(tag_dict):", "    found = set()"]
+
+    # key presence (keys_any + "*" wildcard key_values rules), one test chain
+    # per theme
+    for theme, rule in themes.items():
+        keys = list(rule.get("keys_any", []))
+        keys += [k for k, allowed in rule.get("key_values", {}).items() if allowed == "*"]
+        if keys:
+            cond = " or ".join("%r in tag_dict" % k for k in keys)
+            lines.append("    if %s:" % cond)
+            lines.append("        found.add(%r)" % theme)
+
+    # key_values grouped by key so each key is fetched once
+    by_key: Dict[str, list] = {}
+    for theme, rule in themes.items():
+        for k, allowed in rule.get("key_values", {}).items():
+            if allowed != "*":
+                by_key.setdefault(k, []).append((theme, set(map(str, allowed))))
+    for k, pairs in by_key.items():
+        lines.append("    _v = tag_dict.get(%r)" % k)
+        lines.append("    if _v is not None:")
+        for theme, vals in pairs:
+            lines.append("        if _v in %r:" % (vals,))
+            lines.append("            found.add(%r)" % theme)
+
+    # prefixes: one pass over the row's keys with unrolled tests
+    prefix_pairs = [(pfx, theme)
+                    for theme, rule in themes.items()
+                    for pfx in rule.get("key_prefixes", [])]
+    if prefix_pairs:
+        lines.append("    for _k in tag_dict:")
+        for pfx, theme in prefix_pairs:
+            lines.append("        if _k.startswith(%r):" % pfx)
+            lines.append("            found.add(%r)" % theme)
+
+    lines.append("    if not found:")
+    lines.append("        found.add(%r)" % fallback)
+    lines.append("    return found")
+
+    ns: dict = {}
+    exec(compile("\n".join(lines), "<osm_fast codegen>", "exec"), ns)
+    return ns["_classify"]
+
+
+def _classify_indexed(tag_dict: Dict[str, str]) -> Set[str]:
+    """Index-based classifier; fallback when codegen is unavailable."""
+    found: Set[str] = set()
+    for k, v in tag_dict.items():
+        themes = _KEYS_ANY_INDEX.get(k)
+        if themes:
+            found |= themes
+        themes = _KEY_VALUES_INDEX.get((k, v))
+        if themes:
+            found |= themes
+        themes = _KEY_ANY_VALUE_INDEX.get(k)
+        if themes:
+            found |= themes
+        if _ALL_PREFIXES:
+            # Sorted-prefix binary search: any prefix of k sorts <= k and
+            # shares its first character, so bisect then walk back while the
+            # first character still matches — O(log P + matches) per key
+            # instead of testing every prefix.
+            j = bisect_right(_ALL_PREFIXES, k) - 1
+            c0 = k[:1]
+            while j >= 0 and _ALL_PREFIXES[j][:1] == c0:
+                pfx = _ALL_PREFIXES[j]
+                if k.startswith(pfx):
+                    found |= _PREFIX_INDEX[pfx]
+                j -= 1
+    if not found:
+        found.add(_FALLBACK_THEME)
+    return found
+
+
+_CLASSIFY: Callable[[Dict[str, str]], Set[str]] = _classify_indexed
+
+
+def init_themes(themes: Dict[str, dict], fallback: str) -> None:
+    """Build the inverted lookup indexes and the specialized classifier from a
+    THEMES config dict. Must be called before classify_themes (2osm_gdb_fc
+    does this right after its THEMES block)."""
+    global _KEYS_ANY_INDEX, _KEY_VALUES_INDEX, _KEY_ANY_VALUE_INDEX
+    global _PREFIX_INDEX, _ALL_PREFIXES, _FALLBACK_THEME, _CLASSIFY
+    (_KEYS_ANY_INDEX, _KEY_VALUES_INDEX,
+     _KEY_ANY_VALUE_INDEX, _PREFIX_INDEX) = _build_theme_indexes(themes)
+    _ALL_PREFIXES = tuple(sorted(_PREFIX_INDEX))
+    _FALLBACK_THEME = fallback
+    try:
+        _CLASSIFY = _codegen_classifier(themes, fallback)
+    except Exception:
+        _CLASSIFY = _classify_indexed
+
+
+def classify_themes(tag_dict: Dict[str, str]) -> Set[str]:
+    return _CLASSIFY(tag_dict)
@@ -64,6 +64,12 @@ def main():
         log("No input GDBs found. Check INPUT_PARENT_FOLDER and GDB_GLOB_PATTERN.")
         return
 
+    # Pure bulk-load run: skip attachment/GlobalID bookkeeping the inputs
+    # don't have, and batch File-GDB commits instead of flushing per row.
+    arcpy.env.maintainAttachments = False
+    arcpy.env.preserveGlobalIds = False
+    arcpy.env.autoCommit = 10000
+
     ensure_gdb(OUTPUT_GDB)
 
     # Create target feature classes (use geometry type taken from first found)
@@ -72,16 +78,17 @@ def main():
     for name in FEATURES:
         targets[name] = create_fc(OUTPUT_GDB, name, geom_map[name])
 
-    # Append from each input GDB
-    for gdb in input_gdbs:
-        log(f"Processing {gdb}")
-        for name in FEATURES:
-            src = os.path.join(gdb, name)
-            if arcpy.Exists(src):
-                log(f"  Appending {name} …")
-                arcpy.management.Append(src, targets[name], "NO_TEST")
-            else:
-                log(f"  Skipping {name} (not found)")
+    # One multi-source Append per target instead of one call per input GDB:
+    # a single call amortizes the journal flushes and index maintenance that
+    # dominate when appending tens of batches.
+    for name in FEATURES:
+        srcs = [os.path.join(gdb, name) for gdb in input_gdbs]
+        srcs = [s for s in srcs if arcpy.Exists(s)]
+        if not srcs:
+            log(f"Skipping {name} (not found in any input GDB)")
+            continue
+        log(f"Appending {name} from {len(srcs)} of {len(input_gdbs)} input GDBs …")
+        arcpy.management.Append(srcs, targets[name], "NO_TEST")
 
     # Optional: clean geometries
     log("Repairing geometry on output …")
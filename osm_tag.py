@@ -16,12 +16,12 @@ Dependencies: ArcGIS Pro / ArcPy (no external packages)
 """
 
 import os
-import re
-import json
-import ast
+import sys
 import arcpy
 from collections import Counter
 
+from osm_fast import parse_tags
+
 # ---------------- CONFIG ----------------
 GDB_PATH      = r"C:\Users\name\Desktop\osm_batches\osm_clipped100.gdb"
 POINTS_FC     = "osm_points"
@@ -39,6 +39,13 @@ OUT_TXT       = r"C:\Users\name\Desktop\osm_tag_inventory.txt"
 
 # Optional: limit output list length per section (None = unlimited)
 TOP_N         = None  # e.g., 1000
+
+# Pull the tags column in bulk with FeatureClassToNumPyArray instead of a
+# row-by-row SearchCursor. Chunked by OID range because a numpy text column
+# allocates the full field width for every row: at the U8000 width this
+# pipeline writes that is ~32 KB/row, so 1024 rows is ~32 MB per pull.
+USE_NUMPY_SCAN = True
+NUMPY_SCAN_CHUNK = 1024
 # ---------------------------------------
 
 arcpy.env.overwriteOutput = True
@@ -53,67 +60,53 @@ def detect_tag_field(fc, candidates):
             return existing[c.lower()]
     return None
 
-def parse_tags(raw):
-    """
-    Parse a tags cell into dict {key: value}.
-    Handles JSON, Python-literal dicts, and delimited "k=v;k2=v2" strings.
-    """
-    if raw is None:
-        return {}
-    txt = str(raw).strip()
-    if not txt or txt.lower() in ("null", "none", "nan"):
-        return {}
-
-    # Try JSON
-    try:
-        obj = json.loads(txt)
-        if isinstance(obj, dict):
-            return {str(k): ("" if v is None else str(v)) for k, v in obj.items()}
-    except Exception:
-        pass
-
-    # Try Python-literal dict
-    try:
-        obj = ast.literal_eval(txt)
-        if isinstance(obj, dict):
-            return {str(k): ("" if v is None else str(v)) for k, v in obj.items()}
-    except Exception:
-        pass
-
-    # Fallback: delimited "k=v;k2=v2" or "k:v"
-    out = {}
-    tokens = re.split(r"[;,]\s*", txt)
-    for t in tokens:
-        if not t:
-            continue
-        if "=" in t:
-            k, v = t.split("=", 1)
-        elif ":" in t and "://" not in t:
-            k, v = t.split(":", 1)
-        else:
-            # bare key -> treat as boolean true
-            k, v = t, "true"
-        k = k.strip()
-        v = "" if v is None else str(v).strip()
-        if k:
-            out[str(k)] = v
-    return out
+def iter_tag_column(fc_path, tag_field_name):
+    """Yield raw tags cells via chunked FeatureClassToNumPyArray pulls.
+
+    An attribute-only scan doesn't need the per-row geometry marshalling of a
+    SearchCursor; each chunk is one C-level column pull. Chunked by OID range
+    so the U<width> numpy column never holds more than NUMPY_SCAN_CHUNK rows."""
+    oid_field = arcpy.Describe(fc_path).OIDFieldName
+
+    # OIDs are a cheap fixed-width pull; they bound the chunk windows
+    oids = arcpy.da.FeatureClassToNumPyArray(fc_path, [oid_field])[oid_field]
+    if oids.size == 0:
+        return
+    lo, hi = int(oids.min()), int(oids.max())
+
+    for start in range(lo, hi + 1, NUMPY_SCAN_CHUNK):
+        where = f"{oid_field} >= {start} AND {oid_field} < {start + NUMPY_SCAN_CHUNK}"
+        chunk = arcpy.da.FeatureClassToNumPyArray(
+            fc_path, [tag_field_name], where_clause=where, skip_nulls=True
+        )
+        for raw in chunk[tag_field_name]:
+            yield raw
 
 def count_tags_in_layer(fc_path, mode, tag_field_name):
     """
     Return a Counter of keys or key=values for a single layer.
     """
     counter = Counter()
-    fields = [tag_field_name]
-    with arcpy.da.SearchCursor(fc_path, fields) as sc:
-        for (tags_raw,) in sc:
+    key_values_mode = mode.upper() == "KEY_VALUES"  # hoisted out of the row loop
+
+    def tally(raw_values):
+        for tags_raw in raw_values:
             td = parse_tags(tags_raw)
             if not td:
                 continue
-            if mode.upper() == "KEY_VALUES":
-                counter.update([f"{k}={v}" for k, v in td.items()])
+            # Generators, not throwaway lists; sys.intern dedupes the heavily
+            # repeated strings (highway, building, ...) so Counter hashes
+            # pointer-equal objects and memory stays flat.
+            if key_values_mode:
+                counter.update(sys.intern(f"{k}={v}") for k, v in td.items())
             else:
-                counter.update(td.keys())
+                counter.update(map(sys.intern, td))
+
+    if USE_NUMPY_SCAN:
+        tally(iter_tag_column(fc_path, tag_field_name))
+    else:
+        with arcpy.da.SearchCursor(fc_path, [tag_field_name]) as sc:
+            tally(r[0] for r in sc)
     return counter
 
 def write_counter_section(fh, title, counter, top_n=None):
@@ -162,9 +155,11 @@ def main():
             per_layer_results.append((fc, None, Counter()))
             continue
 
-        count = int(arcpy.management.GetCount(fc)[0])
-        log(f"Scanning: {fc}  (features: {count}, tags field: {tag_field})")
+        # No GetCount first: that is a second full scan of the layer just for
+        # the log line; the cursor pass below already touches every row.
+        log(f"Scanning: {fc}  (tags field: {tag_field})")
         c = count_tags_in_layer(fc, MODE, tag_field)
+        log(f"  ... {sum(c.values())} tag occurrences, {len(c)} unique")
         per_layer_results.append((fc, tag_field, c))
         overall.update(c)
 
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+Optional AOT build of the per-row hot path (osm_fast.py) with mypyc:
+
+    python setup.py build_ext --inplace
+
+parse_tags/classify_themes run once per OSM feature, so compiling them away
+from the interpreter is the cheapest large speedup available. The scripts
+import osm_fast the same way either way — without mypyc (or without running
+the build) they simply use the pure-Python module.
+"""
+
+from setuptools import setup
+
+try:
+    from mypyc.build import mypycify
+    ext_modules = mypycify(["osm_fast.py"])
+except ImportError:
+    ext_modules = []
+
+setup(
+    name="osm-transformation-fast",
+    version="0.1",
+    ext_modules=ext_modules,
+)